@@ -17,15 +17,352 @@ import re
 import sys
 import pty
 import time
+import select
+import signal
 import termios
 import codecs
+import functools
 
-from threading import Thread, Event, Lock
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+from threading import Lock
 from subprocess import Popen
-from queue import Queue, Empty
 
 __all__ = ["spawn", "ExpectTimeoutError"]
 
+#: number of bytes requested from the terminal by each read system call
+READ_SIZE = 65536
+#: maximum number of bytes read from the terminal before returning to the caller
+MAX_READ_SIZE = 1048576
+#: consumed buffer size above which the buffer gets compacted
+COMPACT_THRESHOLD = 65536
+#: wait for the terminal with poll instead of select
+#: except on macOS where poll does not support terminal devices
+POLL = hasattr(select, "poll") and sys.platform != "darwin"
+
+
+#: encoding of the data read from and written to the terminal
+ENCODING = "utf-8"
+#: decoding error handler
+ERRORS = "backslashreplace"
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(pattern, escape=False, as_bytes=False, flags=0):
+    """Return compiled regex for the pattern.
+
+    :param pattern: pattern string
+    :param escape: escape pattern, default: ``False``
+    :param as_bytes: compile pattern to match bytes, default: ``False``
+    :param flags: regex flags, default: ``0``
+    """
+    if escape:
+        pattern = re.escape(pattern)
+    if as_bytes:
+        return re.compile(pattern.encode(ENCODING), flags & ~re.UNICODE)
+    return re.compile(pattern, flags)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_any(patterns, escape=False):
+    """Return compiled regex that matches any of the patterns
+    where each pattern is wrapped into a group named
+    by its index prefixed with an underscore or ``None``
+    if any of the patterns has groups or global flags
+    that would change the meaning of the joined regex.
+
+    :param patterns: tuple of pattern strings
+    :param escape: escape patterns, default: ``False``
+    """
+    flags = _compile("").flags
+    for pattern in patterns:
+        pattern = _compile(pattern, escape)
+        if pattern.groups or pattern.flags != flags:
+            return None
+    if escape:
+        patterns = [re.escape(pattern) for pattern in patterns]
+    return re.compile(
+        "|".join("(?P<_%d>%s)" % (i, pattern) for i, pattern in enumerate(patterns))
+    )
+
+
+def _decode(data):
+    """Decode bytes read from the terminal.
+
+    :param data: bytes-like object
+    """
+    return str(data, ENCODING, ERRORS)
+
+
+def _text(data):
+    """Decode bytes read from the terminal for matching
+    so that each byte of an invalid or incomplete sequence
+    is kept as a separate character.
+
+    :param data: bytes-like object
+    """
+    return str(data, ENCODING, "surrogateescape")
+
+
+def _size(text):
+    """Return the number of bytes that the text
+    returned by _text() was decoded from.
+
+    :param text: text
+    """
+    return len(text.encode(ENCODING, "surrogateescape"))
+
+
+def _complete(data):
+    """Return the size of the data without an incomplete
+    multibyte character at its end.
+
+    :param data: bytes-like object
+    """
+    size = len(data)
+    for i in range(size - 1, max(size - 4, -1), -1):
+        if data[i] < 0x80:
+            break
+        if data[i] >= 0xC0:
+            length = 2 if data[i] < 0xE0 else 3 if data[i] < 0xF0 else 4
+            if size - i < length:
+                return i
+            break
+    return size
+
+
+def _boundary(data, pos):
+    """Return the start of the character
+    at the position in UTF-8 encoded data.
+
+    :param data: bytes-like object
+    :param pos: position
+    """
+    start = max(pos - 3, 0)
+    while start < pos < len(data) and data[pos] & 0xC0 == 0x80:
+        pos -= 1
+    return pos
+
+
+class _Decoder(object):
+    """Incremental decoder for the data read from the terminal
+    that decodes chunks ending with an ASCII byte directly when
+    there is no incomplete character left from the previous chunk.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder(ENCODING)(errors=ERRORS)
+        self._pending = False
+
+    def decode(self, data):
+        if not self._pending and data and data[-1] < 0x80:
+            return _decode(data)
+        text = self._decoder.decode(data)
+        self._pending = bool(self._decoder.getstate()[0])
+        return text
+
+
+def _nodes(parsed):
+    """Yield opcodes and their arguments for all the nodes
+    of the parsed pattern including nested ones.
+
+    :param parsed: parsed pattern or its operand
+    """
+    if isinstance(parsed, sre_parse.SubPattern):
+        for op, av in parsed:
+            yield op, av
+            if op is sre_parse.IN:
+                for item in av:
+                    yield item
+            else:
+                for item in _nodes(av):
+                    yield item
+    elif isinstance(parsed, (tuple, list)):
+        for av in parsed:
+            for item in _nodes(av):
+                yield item
+
+
+def _flags(parsed):
+    """Return global flags of the parsed pattern.
+
+    :param parsed: parsed pattern
+    """
+    # parsing state was kept in the pattern attribute before Python 3.8
+    state = getattr(parsed, "state", None) or parsed.pattern
+    return state.flags
+
+
+def _lookahead(parsed):
+    """Return ``True`` if a match of the parsed pattern depends on
+    the data that follows it.
+
+    :param parsed: parsed pattern
+    """
+    for op, av in _nodes(parsed):
+        if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT) and av[0] > 0:
+            return True
+        if op is sre_parse.AT and av in (
+            sre_parse.AT_BOUNDARY,
+            sre_parse.AT_NON_BOUNDARY,
+            sre_parse.AT_END,
+            sre_parse.AT_END_STRING,
+        ):
+            return True
+    return False
+
+
+def _lookbehind(parsed):
+    """Return the maximum number of characters before a match
+    of the parsed pattern that its lookbehind assertions can look at.
+
+    :param parsed: parsed pattern
+    """
+    width = 0
+    for op, av in _nodes(parsed):
+        if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT) and av[0] < 0:
+            width = max(width, av[1].getwidth()[1])
+    return width
+
+
+def _ascii(parsed):
+    """Return ``True`` if the parsed pattern matches only non-empty
+    ASCII text and matching it against UTF-8 encoded bytes gives
+    the same matches as matching it against the decoded text.
+
+    :param parsed: parsed pattern
+    """
+    flags = _flags(parsed)
+    ascii = flags & re.ASCII
+    if flags & re.IGNORECASE and not ascii:
+        return False
+    if parsed.getwidth()[0] == 0:
+        return False
+    for op, av in _nodes(parsed):
+        if op in (sre_parse.ANY, sre_parse.NOT_LITERAL, sre_parse.NEGATE):
+            return False
+        if op is sre_parse.LITERAL and av >= 0x80:
+            return False
+        if op is sre_parse.RANGE and av[1] >= 0x80:
+            return False
+        if op is sre_parse.SUBPATTERN and av[1] & re.IGNORECASE and not ascii:
+            return False
+        if op is sre_parse.CATEGORY and (
+            not ascii
+            or av
+            in (
+                sre_parse.CATEGORY_NOT_DIGIT,
+                sre_parse.CATEGORY_NOT_SPACE,
+                sre_parse.CATEGORY_NOT_WORD,
+            )
+        ):
+            # negated categories match each byte of a multibyte character
+            return False
+        if (
+            op is sre_parse.AT
+            and av in (sre_parse.AT_BOUNDARY, sre_parse.AT_NON_BOUNDARY)
+            and not ascii
+        ):
+            return False
+    return True
+
+
+def _overlap(parsed):
+    """Return the number of already scanned bytes that
+    have to be scanned again when new data arrives or ``None``
+    if the whole buffer must be scanned because the match width
+    of the parsed pattern is unbounded or it has lookahead assertions.
+
+    :param parsed: parsed pattern
+    """
+    width = parsed.getwidth()[1]
+    if width >= sre_parse.MAXREPEAT:
+        return None
+    overlap = max(width - 1, 0)
+    for op, av in _nodes(parsed):
+        if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT) and av[0] > 0:
+            return None
+        if op is sre_parse.AT and av in (
+            sre_parse.AT_BOUNDARY,
+            sre_parse.AT_NON_BOUNDARY,
+        ):
+            # word boundary at the end of the match depends on the next byte
+            overlap = width
+    return overlap
+
+
+@functools.lru_cache(maxsize=256)
+def _analyze(pattern, flags=0):
+    """Return a tuple of ``(overlap, lookahead, lookbehind, ascii)``
+    for the pattern, see _overlap(), _lookahead(), _lookbehind()
+    and _ascii(). If the pattern can't be analyzed then values that
+    are safe for any pattern are returned.
+
+    :param pattern: pattern string
+    :param flags: pattern flags, default: ``0``
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+        return (
+            _overlap(parsed),
+            _lookahead(parsed),
+            _lookbehind(parsed),
+            _ascii(parsed),
+        )
+    except Exception:
+        # the parser is internal to the re module and can change
+        return None, True, None, False
+
+
+@functools.lru_cache(maxsize=256)
+def _prepare(pattern):
+    """Return a tuple of ``(pattern, raw_pattern, overlap, lookahead, lookbehind)``
+    used to search for the compiled pattern in the bytes read from the terminal
+    where raw_pattern is a bytes pattern that finds the same matches as
+    the pattern or ``None`` if decoded data has to be searched.
+
+    :param pattern: compiled pattern
+    """
+    overlap, lookahead, lookbehind, ascii = _analyze(pattern.pattern, pattern.flags)
+    raw_pattern = pattern
+    if isinstance(pattern.pattern, str):
+        raw_pattern = None
+        if ascii:
+            try:
+                raw_pattern = _compile(
+                    pattern.pattern, as_bytes=True, flags=pattern.flags
+                )
+            except (re.error, ValueError):
+                # flags such as (?u) are not allowed in bytes patterns
+                pass
+        if raw_pattern is None and overlap is not None:
+            # each character can take up to 4 bytes and
+            # an incomplete character at the end is not searched
+            overlap = overlap * 4 + 3
+    return pattern, raw_pattern, overlap, lookahead, lookbehind
+
+
+if sys.version_info >= (3, 8):
+
+    def _hex(data):
+        """Return comma separated hex dump of the bytes.
+
+        :param data: bytes
+        """
+        return data.hex(",")
+
+else:
+
+    def _hex(data):
+        """Return comma separated hex dump of the bytes.
+
+        :param data: bytes
+        """
+        return ",".join(["%02x" % c for c in data])
+
 
 class TimeoutError(Exception):
     def __init__(self, timeout):
@@ -43,11 +380,13 @@ class ExpectTimeoutError(Exception):
 
     def __str__(self):
         s = "Timeout %.3fs " % float(self.timeout)
-        if self.pattern:
+        if isinstance(self.pattern, tuple):
+            s += "for any of %s " % repr(tuple(p.pattern for p in self.pattern))
+        elif self.pattern:
             s += "for %s " % repr(self.pattern.pattern)
         if self.buffer:
             s += "buffer %s " % repr(self.buffer[:])
-            s += "or '%s'" % ",".join(["%x" % ord(c) for c in self.buffer[:]])
+            s += "or '%s'" % _hex(self.buffer.encode(ENCODING, ERRORS))
         return s
 
 
@@ -65,33 +404,77 @@ class IO(object):
         def __init__(self, logger, prefix=""):
             self._logger = logger
             self._prefix = prefix
+            self._newline = "\n" + prefix
+            self._newline_bytes = self._newline.encode(ENCODING)
+            self._decoder = _Decoder()
+            self._buffer = None
+            self._line_buffering = getattr(logger, "line_buffering", False)
+            encoding = getattr(logger, "encoding", None)
+            # bytes can only bypass a text logger that never keeps
+            # pending text that would be written after them
+            if (
+                getattr(logger, "write_through", False)
+                and encoding
+                and codecs.lookup(encoding) == codecs.lookup(ENCODING)
+            ):
+                self._buffer = getattr(logger, "buffer", None)
             self.write(self._prefix)
 
         def write(self, data):
             if not data:
                 return
-            self._logger.write(data.replace("\n", "\n" + self._prefix))
+            if not isinstance(data, str):
+                if self._buffer is not None:
+                    return self._write_bytes(data)
+                data = self._decoder.decode(data)
+            if self._prefix:
+                data = data.replace("\n", self._newline)
+            self._logger.write(data)
+
+        def _write_bytes(self, data):
+            """Write bytes directly to the binary buffer
+            of the text logger skipping decoding and encoding.
+
+            :param data: bytes-like object
+            """
+            if self._prefix:
+                data = bytes(data).replace(b"\n", self._newline_bytes)
+            self._buffer.write(data)
+            if self._line_buffering:
+                self._buffer.flush()
 
         def flush(self):
             self._logger.flush()
 
-    def __init__(self, process, master, queue, reader):
+    def __init__(self, process, master):
         self.process = process
         self.master = master
-        self.queue = queue
-        self.buffer = None
         self.before = None
         self.after = None
         self.match = None
         self.pattern = None
-        self.reader = reader
         self._timeout = None
+        self._search_window = None
         self._logger = None
         self._logger_buffer_pos = 0
+        self._buffer = bytearray()
+        self._decoder = _Decoder()
+        self._head = 0
+        self._scan_pos = 0
+        self._slab = bytearray(READ_SIZE)
+        self._slab_view = memoryview(self._slab)
+        self._err = None
         self._eol = ""
+        self._eol_bytes = b""
         self._closed = False
         self._lock = Lock()
 
+    @property
+    def buffer(self):
+        """Data that was read but not yet consumed by expect."""
+        with memoryview(self._buffer) as view:
+            return _decode(view[self._head :]) or None
+
     def __enter__(self):
         return self
 
@@ -108,17 +491,29 @@ class IO(object):
             self._timeout = timeout
         return self._timeout
 
+    def search_window(self, size=None):
+        """Set or get the maximum number of unconsumed bytes
+        kept in the buffer while waiting for a match. Older bytes are
+        dropped and will not be part of the before attribute.
+        By default the buffer is not limited.
+
+        :param size: window size in bytes, default: ``None``
+        """
+        if size:
+            self._search_window = size
+        return self._search_window
+
     def eol(self, eol=None):
         if eol:
             self._eol = eol
+            self._eol_bytes = eol.encode(ENCODING)
         return self._eol
 
     def close(self, force=True):
         with self._lock:
             if not self._closed:
                 try:
-                    self.reader["kill_event"].set()
-                    os.system("pkill -TERM -P %d" % self.process.pid)
+                    _kill_children(self.process.pid, signal.SIGTERM)
                     if force:
                         self.process.kill()
                     else:
@@ -130,138 +525,298 @@ class IO(object):
                 finally:
                     self._closed = True
 
-    def send(self, data, eol=None, delay=None):
+    def _wait(self, write=False, timeout=None):
+        """Wait until the terminal can be read or written
+        and return ``True`` if it happened before the timeout.
+
+        :param write: wait for the terminal to be writable, default: ``False``
+        :param timeout: timeout, default: ``None``
+        """
+        if not POLL:
+            rlist, wlist = ([], [self.master]) if write else ([self.master], [])
+            return any(select.select(rlist, wlist, [], timeout))
+        poll = select.poll()
+        poll.register(self.master, select.POLLOUT if write else select.POLLIN)
+        return bool(poll.poll(None if timeout is None else timeout * 1000))
+
+    def _consume(self, end):
+        """Mark buffer data up to the end position as consumed.
+
+        :param end: end position
+        """
+        self._head = end
+        self._logger_buffer_pos = max(self._logger_buffer_pos, end)
+        self._scan_pos = max(self._scan_pos, end)
+        if self._head >= len(self._buffer):
+            self._buffer = bytearray()
+            self._head = 0
+            self._logger_buffer_pos = 0
+            self._scan_pos = 0
+        elif self._head > max(COMPACT_THRESHOLD, len(self._buffer) // 2):
+            self._buffer = self._buffer[self._head :]
+            self._logger_buffer_pos -= self._head
+            self._scan_pos -= self._head
+            self._head = 0
+
+    def send(self, data, eol=None, delay=None, drain=False):
         if eol is None:
-            eol = self._eol
+            eol, eol_bytes = self._eol, self._eol_bytes
+        else:
+            eol_bytes = eol.encode(ENCODING)
         if delay is not None:
             time.sleep(delay)
-        return self.write(data + eol)
+        self._write([data.encode(ENCODING), eol_bytes], drain=drain)
+        return len(data) + len(eol)
+
+    def flush(self):
+        """Wait until all written data is transmitted to the terminal."""
+        with self._lock:
+            if self._closed:
+                raise IOError("closed")
+            termios.tcdrain(self.master)
 
-    def write(self, data):
-        def _write(bytes_data):
-            while bytes_data:
-                n = os.write(self.master, bytes_data[:-1][:8] or bytes_data)
-                bytes_data = bytes_data[n:]
-                if bytes_data:
-                    time.sleep(0.00001)
+    def write(self, data, drain=False):
+        self._write([data.encode(ENCODING)], drain=drain)
+        return len(data)
 
+    def _write(self, buffers, drain=False):
+        """Write data to the terminal in small chunks.
+
+        :param buffers: list of bytes to write
+        :param drain: wait until data is transmitted, default: ``False``
+        """
         with self._lock:
             if self._closed:
                 raise IOError("closed")
-            _write(data.encode("utf-8"))
-            return len(data)
+            pause = False
+            for data in buffers:
+                data = memoryview(data)
+                while data:
+                    if pause:
+                        time.sleep(0.00001)
+                    try:
+                        n = os.write(self.master, data[:-1][:8] or data)
+                    except BlockingIOError:
+                        self._wait(write=True)
+                        continue
+                    data = data[n:]
+                    pause = True
+            if drain:
+                termios.tcdrain(self.master)
+
+    def _search(self, pattern, raw_pattern, lookahead, lookbehind):
+        """Search unconsumed buffer data from the scan position
+        and return the match and its start and end positions in the buffer
+        or ``(None, None, None)`` if there is no match.
+
+        :param pattern: compiled pattern
+        :param raw_pattern: compiled bytes pattern that finds the same
+            matches as the pattern or ``None`` to search decoded data
+        :param lookahead: pattern looks past the end of the match
+        :param lookbehind: number of characters before the match
+            the pattern looks at or ``None`` if not known
+        """
+        with memoryview(self._buffer) as view:
+            with view[self._head :] as data:
+                pos = self._scan_pos - self._head
+                if raw_pattern is None:
+                    # decode only data from the scan position and enough
+                    # characters before it for lookbehind and \b to work
+                    pos = _boundary(data, pos)
+                    base = 0
+                    if lookbehind is not None:
+                        base = _boundary(data, max(pos - (lookbehind + 1) * 4, 0))
+                    text = _text(data[base : _complete(data)])
+                    offset = len(_text(data[base:pos]))
+                    match = pattern.search(text, offset)
+                    if match is None:
+                        return None, None, None
+                    start = pos + _size(text[offset : match.start()])
+                    end = start + _size(match.group())
+                else:
+                    match = raw_pattern.search(data, pos)
+                    if match is None:
+                        return None, None, None
+                    start, end = match.span()
+                    limit = len(data) if lookahead else end
+                    if raw_pattern is pattern:
+                        match = pattern.search(bytes(data[:limit]), start)
+                    else:
+                        offset = len(_text(data[:start]))
+                        match = pattern.search(_text(data[:limit]), offset)
+        return match, self._head + start, self._head + end
 
     def expect(self, pattern, timeout=None, escape=False, expect_timeout=False):
+        if isinstance(pattern, str):
+            pattern = _compile(pattern, escape)
+        return self._expect([pattern], pattern, timeout, expect_timeout)[1]
+
+    def expect_any(self, patterns, timeout=None, escape=False, expect_timeout=False):
+        """Expect any of the patterns and return the index
+        of the pattern that matched and the match. Patterns are joined
+        into a single regex unless any of them has groups or global flags
+        in which case each pattern is searched separately.
+
+        :param patterns: list of pattern strings
+        :param timeout: timeout, default: ``None``
+        :param escape: escape patterns, default: ``False``
+        :param expect_timeout: expect timeout, default: ``False``
+        """
+        patterns = tuple(patterns)
+        pattern = _compile_any(patterns, escape)
+        if pattern is not None:
+            match = self.expect(pattern, timeout=timeout, expect_timeout=expect_timeout)
+            if match is None:
+                return None, None
+            return int(match.lastgroup[1:]), match
+        patterns = [_compile(pattern, escape) for pattern in patterns]
+        return self._expect(patterns, tuple(patterns), timeout, expect_timeout)
+
+    def _expect(self, patterns, error_pattern, timeout, expect_timeout):
+        """Expect any of the compiled patterns and return the index
+        of the pattern that matched first and the match.
+
+        :param patterns: list of compiled patterns
+        :param error_pattern: pattern to report in ExpectTimeoutError
+        :param timeout: timeout
+        :param expect_timeout: expect timeout
+        """
         self.match = None
         self.before = None
         self.after = None
-        if escape:
-            pattern = re.escape(pattern)
-        pattern = re.compile(pattern)
+        index = None
+        searches = [_prepare(pattern) for pattern in patterns]
+        overlaps = [overlap for _, _, overlap, _, _ in searches]
+        overlap = None if None in overlaps else max(overlaps)
         if timeout is None:
             timeout = self._timeout
         timeleft = timeout
-        if timeleft is None:
-            timeleft = sys.maxsize
+        self._scan_pos = self._head
         while True:
-            start_time = time.time()
-
-            if self.buffer is not None:
-                self.match = pattern.search(self.buffer, 0)
-                if self.match is not None:
-                    if self._logger:
-                        self._logger.write(
-                            self.buffer[self._logger_buffer_pos : self.match.end()]
-                        )
-                    self.after = self.buffer[self.match.start() : self.match.end()]
-                    self.before = self.buffer[: self.match.start()]
-                    self.buffer = self.buffer[self.match.end() :]
-                    self._logger_buffer_pos = 0
+            start_time = time.monotonic()
+
+            if self._buffer:
+                match = start = end = None
+                for i, (pattern, raw_pattern, _, lookahead, lookbehind) in enumerate(
+                    searches
+                ):
+                    found = self._search(pattern, raw_pattern, lookahead, lookbehind)
+                    if found[0] is not None and (match is None or found[1] < start):
+                        index, (match, start, end) = i, found
+                if match is not None:
+                    with memoryview(self._buffer) as view:
+                        if self._logger:
+                            self._logger.write(view[self._logger_buffer_pos : end])
+                        self.before = _decode(view[self._head : start])
+                        self.after = _decode(view[start:end])
+                    self.match = match
+                    self._consume(end)
                     break
-                elif self._logger and not expect_timeout:
-                    self._logger.write(self.buffer[self._logger_buffer_pos :])
-                    self._logger_buffer_pos = len(self.buffer)
-
-            try:
-                data = None
-                data = self.read(timeout=min(timeleft, 0.1), raise_exception=True)
-            except TimeoutError:
-                elapsed = time.time() - start_time
-                timeleft = max(timeleft - elapsed, 0)
-                if timeleft <= 0:
-                    if self._logger and not expect_timeout:
-                        self._logger.write(
-                            (self.buffer or "")[self._logger_buffer_pos :] + "\n"
-                        )
-                        self._logger.flush()
-                    exception = ExpectTimeoutError(pattern, timeout, self.buffer)
-                    self.before = self.buffer
-                    self.after = None
-                    if not expect_timeout:
-                        self.buffer = None
-                        self._logger_buffer_pos = 0
-                    if expect_timeout:
-                        return
-                    raise exception
-            else:
-                elapsed = time.time() - start_time
-                timeleft = max(timeleft - elapsed, 0)
-            if data:
-                self.buffer = (self.buffer + data) if self.buffer else data
-
-        return self.match
+                if overlap is not None:
+                    self._scan_pos = max(self._head, len(self._buffer) - overlap)
+                if self._logger and not expect_timeout:
+                    with memoryview(self._buffer) as view:
+                        self._logger.write(view[self._logger_buffer_pos :])
+                    self._logger_buffer_pos = len(self._buffer)
+                if self._search_window is not None:
+                    end = len(self._buffer) - self._search_window
+                    if self._logger:
+                        end = min(end, self._logger_buffer_pos)
+                    if end > self._head:
+                        self._consume(end)
+
+            size = self._read(self._buffer, timeout=timeleft)
+            if timeleft is not None:
+                timeleft = max(timeleft - (time.monotonic() - start_time), 0)
+            if not size and timeleft == 0:
+                if self._logger and not expect_timeout:
+                    self._logger.write(self._buffer[self._logger_buffer_pos :] + b"\n")
+                    self._logger.flush()
+                exception = ExpectTimeoutError(error_pattern, timeout, self.buffer)
+                self.before = self.buffer
+                self.after = None
+                if not expect_timeout:
+                    self._consume(len(self._buffer))
+                if expect_timeout:
+                    return None, None
+                raise exception
+
+        return index, self.match
 
     def read(self, timeout=0, raise_exception=False):
-        with self._lock:
-            if self._closed:
-                raise IOError("closed")
-            data = ""
-            timeleft = timeout
-            try:
-                while timeleft >= 0:
-                    start_time = time.time()
-                    d = self.queue.get(timeout=timeleft)
-                    if isinstance(d, BaseException):
-                        raise d
-                    data += d
-                    if data:
+        data = bytearray()
+        if not self._read(data, timeout, raise_exception):
+            return ""
+        return self._decoder.decode(data)
+
+    def _read(self, buffer, timeout=0, raise_exception=False):
+        """Read all data that is available from the terminal,
+        append it to the buffer and return the number of bytes read.
+
+        :param buffer: bytearray to append the data to
+        :param timeout: time to wait for data, default: ``0``
+        :param raise_exception: raise TimeoutError if no data was read, default: ``False``
+        """
+        size = 0
+        while size < MAX_READ_SIZE:
+            with self._lock:
+                if self._closed:
+                    raise IOError("closed")
+                if self._err is not None:
+                    if size:
                         break
-                    elapsed = time.time() - start_time
-                    timeleft = max(timeleft - elapsed, 0)
-            except Empty:
-                if data:
-                    return data
-                if raise_exception:
-                    raise TimeoutError(timeout)
-                pass
-            if not data and raise_exception:
-                raise TimeoutError(timeout)
+                    err, self._err = self._err, None
+                    raise err
+                try:
+                    n = os.readv(self.master, [self._slab])
+                except BlockingIOError:
+                    n = None
+                except OSError as err:
+                    if not size:
+                        raise
+                    # return data read so far and raise on the next call
+                    self._err = err
+                    break
+                if n:
+                    buffer.extend(self._slab_view[:n])
+                    size += n
+            if n is None:
+                # wait without holding the lock so that other threads
+                # can write to the terminal or close it
+                if size or not self._wait(timeout=timeout):
+                    break
+                continue
+            if not n:
+                break
+        if not size and raise_exception:
+            raise TimeoutError(timeout)
 
-            return data
+        return size
 
 
-def _reader(out, queue, kill_event, encoding="utf-8", errors="backslashreplace"):
-    """Reader thread.
+def _kill_children(pid, sig):
+    """Send signal to the direct children of the process.
+    If the children can't be listed then the signal is sent
+    to the process group of the process.
 
-    :param out: pty master to read from
-    :param queue: data queue
-    :param kill_event: kill event
+    :param pid: process id
+    :param sig: signal
     """
-    decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
-    while True:
+    try:
+        with open("/proc/%d/task/%d/children" % (pid, pid)) as fd:
+            children = [int(child) for child in fd.read().split()]
+    except OSError:
         try:
-            data = os.read(out, 65536)
-            queue.put(decoder.decode(data))
-        except OSError as e:
-            queue.put(e)
-            if e.errno in (5, 9):
-                return
-            raise
-        except BaseException as e:
-            queue.put(e)
-            if kill_event.is_set():
-                return
-            raise
+            os.killpg(pid, sig)
+        except ProcessLookupError:
+            pass
+        return
+
+    for child in children:
+        try:
+            os.kill(child, sig)
+        except ProcessLookupError:
+            pass
 
 
 def spawn(command):
@@ -282,16 +837,6 @@ def spawn(command):
         bufsize=0,
     )
     os.close(slave)
+    os.set_blocking(master, False)
 
-    queue = Queue()
-    reader_kill_event = Event()
-    thread = Thread(target=_reader, args=(master, queue, reader_kill_event))
-    thread.daemon = True
-    thread.start()
-
-    return IO(
-        process,
-        master,
-        queue,
-        reader={"thread": thread, "kill_event": reader_kill_event},
-    )
+    return IO(process, master)
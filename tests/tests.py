@@ -12,6 +12,9 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import time
+import threading
+
 from testflows.core import *
 
 
@@ -49,6 +52,43 @@ def regression(self):
         terminal1.expect(prompt)
 
         terminal1.send("echo Gãńdåłf_Thê_Gręât")
+        match = terminal1.expect(r"G.ńdåłf_\w+\r\n")
+        assert match.group() == "Gãńdåłf_Thê_Gręât\r\n", error()
+        terminal1.expect(prompt)
+
+        terminal1.send("echo A; echo B")
+        terminal1.expect(r"echo B\r\n")
+        terminal1.expect(r"^A")
+        terminal1.expect(prompt)
+
+        terminal1.send("printf 'x-'; sleep 0.5; printf 'a\\n'")
+        terminal1.expect(r"-\b")
+        terminal1.expect(prompt)
+
+        terminal1.send("printf 'b%sr\\n' a")
+        index, match = terminal1.expect_any(["foo2", "bar"])
+        assert index == 1, error()
+        terminal1.expect(prompt)
+
+        terminal1.send("printf 'F%sO\\n' O")
+        index, match = terminal1.expect_any(["foo2", "(?i)foo\r\n"])
+        assert index == 1, error()
+        terminal1.expect(prompt)
+
+        terminal1.send("printf 'a%s\\n' a")
+        index, match = terminal1.expect_any(["foo2", r"(a)\1\r\n"])
+        assert index == 1 and match.group(1) == "a", error()
+        terminal1.expect(prompt)
+
+    with Test("send while another thread waits in expect"):
+        waiter = threading.Thread(target=terminal1.expect, args=("thread_done",))
+        waiter.start()
+        time.sleep(0.5)
+        start_time = time.monotonic()
+        terminal1.send("echo thread_done")
+        elapsed = time.monotonic() - start_time
+        waiter.join()
+        assert elapsed < 0.5, error()
         terminal1.expect(prompt)
 
     with Test("print() using test.message_io()"):